@@ -1,14 +1,383 @@
+# adapters/post_slack.py
+# Slack delivery: shared client + spooled outbound queue (no interactivity yet)
+import argparse
+import json
 import os
+import queue
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
-# Minimal Slack poster (no interactivity yet)
-def post_message(channel: str, text: str):
-    token = os.getenv("SLACK_BOT_TOKEN")
-    if not token:
-        raise RuntimeError("SLACK_BOT_TOKEN not set")
-    client = WebClient(token=token)
-    try:
-        client.chat_postMessage(channel=channel, text=text)
-    except SlackApiError as e:
-        raise RuntimeError(f"Slack error: {e.response['error']}")
+# Optional: load .env if available
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except Exception:
+    pass
+
+class SlackRetryLater(RuntimeError):
+    """Gave up on a retryable failure (rate limit / 5xx / network); the message can be resent later."""
+
+
+# A claimed (*.sending) file older than this is assumed to belong to a dead
+# process and is put back in the spool. Must exceed the longest single send.
+_STALE_CLAIM_SEC = 30 * 60
+# How long close() waits for a stopped worker to leave an in-flight HTTP call.
+_STOP_GRACE_SEC = 5.0
+
+_client: Optional[WebClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> WebClient:
+    """Return a process-wide WebClient (reuses the HTTP setup across messages)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            token = os.getenv("SLACK_BOT_TOKEN")
+            if not token:
+                raise RuntimeError("SLACK_BOT_TOKEN not set")
+            # SLACK_API_BASE_URL lets us point at a local stub server for testing
+            base_url = os.getenv("SLACK_API_BASE_URL") or WebClient.BASE_URL
+            if not base_url.endswith("/"):
+                base_url += "/"
+            _client = WebClient(token=token, base_url=base_url)
+        return _client
+
+
+def _retry_after(e: SlackApiError) -> Optional[float]:
+    """Read the Retry-After header (seconds) from a 429 response, if any."""
+    headers = getattr(e.response, "headers", None) or {}
+    for k, v in headers.items():
+        if k.lower() == "retry-after":
+            if isinstance(v, (list, tuple)):
+                v = v[0] if v else None
+            try:
+                return float(v)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def _sleep(seconds: float, stop: Optional[threading.Event]) -> None:
+    """time.sleep() that a set stop event cuts short with SlackRetryLater."""
+    if stop is None:
+        time.sleep(seconds)
+    elif stop.wait(seconds):
+        raise SlackRetryLater("outbox stopped")
+
+
+def _send(
+    client: WebClient, channel: str, text: str,
+    max_retries: int, base_delay: float, max_rate_limit_wait: float,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """
+    Post one message, honouring Retry-After on 429 (up to max_rate_limit_wait
+    seconds in total) and backing off on HTTP 5xx / network errors.
+    Any other ok:false is not retried.
+    Raises SlackRetryLater when retries run out or `stop` is set, RuntimeError otherwise.
+    """
+    attempt = 0
+    waited = 0.0
+    while True:
+        if stop is not None and stop.is_set():
+            raise SlackRetryLater("outbox stopped")
+        try:
+            client.chat_postMessage(channel=channel, text=text)
+            return
+        except SlackApiError as e:
+            code = e.response.get("error") if hasattr(e.response, "get") else None
+            status = getattr(e.response, "status_code", None) or 0
+            if status == 429 or code == "ratelimited":
+                # rate limit waits do not count against the retry budget, but are capped
+                wait = _retry_after(e) or base_delay
+                if waited + wait > max_rate_limit_wait:
+                    raise SlackRetryLater(f"Slack rate limited for over {max_rate_limit_wait:g}s")
+                waited += wait
+                _sleep(wait, stop)
+                continue
+            if status < 500:
+                # bad channel / arguments / auth ...: the same request fails again
+                raise RuntimeError(f"Slack error: {code or status}")
+            err = f"Slack error: HTTP {status}"
+        except OSError as e:
+            # network level failure (connection refused, reset, timeout ...)
+            err = f"Slack connection error: {e}"
+
+        attempt += 1
+        if attempt > max_retries:
+            raise SlackRetryLater(err)
+        # exponential backoff with jitter
+        _sleep(base_delay * (2 ** (attempt - 1)) * (1 + random.random() * 0.25), stop)
+
+
+# Minimal Slack poster (synchronous, kept for simple callers)
+def post_message(
+    channel: str, text: str,
+    max_retries: int = 3, base_delay: float = 1.0, max_rate_limit_wait: float = 120.0,
+):
+    _send(get_client(), channel, text, max_retries, base_delay, max_rate_limit_wait)
+
+
+class SlackOutbox:
+    """
+    Outbound message queue backed by an on-disk spool.
+
+      - enqueue() writes the message to spool_dir and returns immediately
+      - a background worker posts spooled messages in order via the shared client
+      - delivered messages are removed; undeliverable ones move to spool_dir/failed
+      - messages that ran out of retries (rate limit / 5xx / network) stay spooled
+      - messages left in the spool (crash / early exit) are resent on next start()
+      - each file is claimed by renaming it to *.sending before posting, so two
+        processes draining the same spool never send the same message twice
+      - close(timeout) that runs out stops the worker and hands claims back to the spool
+    """
+
+    def __init__(
+        self,
+        spool_dir: Optional[str] = None,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_rate_limit_wait: float = 300.0,
+        client: Optional[WebClient] = None,
+    ) -> None:
+        self.spool_dir = Path(spool_dir or os.getenv("SLACK_SPOOL_DIR", "storage/slack_outbox"))
+        self.failed_dir = self.spool_dir / "failed"
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self._client = client
+        self._queue: "queue.Queue[Optional[Path]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._inflight: Optional[Tuple[Path, Path]] = None  # (spool path, claimed path)
+        self.sent = 0
+        self.failed = 0
+        self.deferred = 0
+
+    # --- spool ---
+    def enqueue(self, channel: str, text: str, meta: Optional[Dict] = None) -> Path:
+        """Persist a message to the spool and hand it to the worker."""
+        # time-prefixed names keep delivery order when reloading the spool
+        name = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}.json"
+        path = self.spool_dir / name
+        tmp = path.with_suffix(".tmp")
+        payload = {"channel": channel, "text": text, "meta": meta or {}}
+        tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)  # atomic: the worker never sees a partial file
+        if self._worker is not None:
+            self._queue.put(path)  # otherwise picked up from the spool by start()
+        return path
+
+    def pending(self) -> List[Path]:
+        return sorted(self.spool_dir.glob("*.json"))
+
+    def claimed(self) -> List[Path]:
+        """Files being sent right now (by this or another process)."""
+        return sorted(self.spool_dir.glob("*.sending"))
+
+    # --- worker ---
+    def start(self) -> "SlackOutbox":
+        """Start the delivery worker and requeue anything left in the spool."""
+        if self._worker is not None:
+            return self
+        # resolve the client here so a missing token fails in the caller, not the thread
+        self._client = self._client or get_client()
+        self._stop.clear()
+        self._release_stale_claims()
+        for path in self.pending():
+            self._queue.put(path)
+        self._worker = threading.Thread(target=self._run, name="slack-outbox", daemon=True)
+        self._worker.start()
+        return self
+
+    def _run(self) -> None:
+        client = self._client
+        while True:
+            path = self._queue.get()
+            try:
+                if path is None:
+                    return
+                if not self._stop.is_set():  # once stopped, the rest stays spooled
+                    self._deliver(client, path)
+            except Exception as e:
+                # never let one message kill the only worker (flush() would wait forever)
+                print(f"[slack] error on {path.name}: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    def _release_stale_claims(self) -> None:
+        now = time.time()
+        for claimed in self.spool_dir.glob("*.sending"):
+            try:
+                if now - claimed.stat().st_mtime > _STALE_CLAIM_SEC:
+                    os.rename(claimed, claimed.with_suffix(".json"))
+            except FileNotFoundError:
+                pass  # finished by its owner meanwhile
+
+    def _claim(self, path: Path) -> Optional[Path]:
+        """Atomically take ownership of a spooled file; None if someone else has it."""
+        claimed = path.with_suffix(".sending")
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None  # delivered, or claimed by another process
+        os.utime(claimed)  # claim time, for stale-claim recovery
+        return claimed
+
+    @staticmethod
+    def _unclaim(path: Path, claimed: Path) -> None:
+        try:
+            os.rename(claimed, path)
+        except FileNotFoundError:
+            pass  # already handed back by close()
+
+    def _deliver(self, client: WebClient, path: Path) -> None:
+        claimed = self._claim(path)
+        if claimed is None:
+            return
+        self._inflight = (path, claimed)
+        try:
+            self._deliver_claimed(client, path, claimed)
+        finally:
+            self._inflight = None
+
+    def _deliver_claimed(self, client: WebClient, path: Path, claimed: Path) -> None:
+        try:
+            msg = json.loads(claimed.read_text(encoding="utf-8"))
+            channel, text = msg["channel"], msg["text"]
+        except Exception as e:
+            # truncated / hand-edited spool file: park it, keep the worker going
+            self.failed_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(claimed, self.failed_dir / path.name)
+            self.failed += 1
+            print(f"[slack] unreadable {path.name}: {e!r}")
+            return
+        try:
+            _send(
+                client, channel, text,
+                self.max_retries, self.base_delay, self.max_rate_limit_wait, self._stop,
+            )
+        except SlackRetryLater as e:
+            self._unclaim(path, claimed)
+            self.deferred += 1
+            print(f"[slack] kept {path.name} for a later run: {e}")
+            return
+        except RuntimeError as e:
+            self.failed_dir.mkdir(parents=True, exist_ok=True)
+            msg["error"] = str(e)
+            (self.failed_dir / path.name).write_text(json.dumps(msg, ensure_ascii=False), encoding="utf-8")
+            claimed.unlink(missing_ok=True)
+            self.failed += 1
+            print(f"[slack] failed {path.name}: {e}")
+            return
+        except Exception as e:
+            # unexpected (e.g. http.client.IncompleteRead): resend on a later run
+            self._unclaim(path, claimed)
+            self.deferred += 1
+            print(f"[slack] kept {path.name} for a later run: {e!r}")
+            return
+        claimed.unlink(missing_ok=True)
+        self.sent += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the queue is drained. Returns False on timeout (messages stay spooled)."""
+        if self._worker is None:
+            return not self.pending()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        Drain (up to timeout) and stop the worker. On timeout the worker is
+        interrupted and every unsent message, including the one in flight,
+        is left in the spool for the next run.
+        """
+        done = self.flush(timeout)
+        if self._worker is None:
+            return done
+        if not done:
+            self._stop.set()  # cuts Retry-After / backoff sleeps short
+        self._queue.put(None)
+        self._worker.join(None if done else _STOP_GRACE_SEC)
+        if self._worker.is_alive():
+            # stuck in an HTTP call: hand its claim back rather than leave a
+            # fresh *.sending that the next run ignores (may resend it once)
+            inflight = self._inflight
+            if inflight is not None:
+                self._unclaim(*inflight)
+        self._worker = None
+        return done
+
+
+def _ledger(outbox: SlackOutbox) -> Path:
+    return outbox.spool_dir / "queued_drafts.txt"
+
+
+def queue_draft(outbox: SlackOutbox, channel: str, draft: Path, text: Optional[str] = None) -> bool:
+    """
+    Spool one draft file and record its name in <spool_dir>/queued_drafts.txt,
+    so enqueue_drafts() never queues it again. Returns False for empty drafts.
+    """
+    text = (draft.read_text(encoding="utf-8") if text is None else text).strip()
+    if not text:
+        return False
+    outbox.enqueue(channel, text, meta={"draft": draft.name})
+    # record right away so a crash mid-batch does not double-queue
+    with _ledger(outbox).open("a", encoding="utf-8") as fw:
+        fw.write(draft.name + "\n")
+    return True
+
+
+def enqueue_drafts(outbox: SlackOutbox, channel: str, drafts_dir: str = "storage/drafts") -> List[str]:
+    """Spool every draft in drafts_dir that has not been queued before."""
+    ledger = _ledger(outbox)
+    done = set(ledger.read_text(encoding="utf-8").split()) if ledger.exists() else set()
+    queued = []
+    for p in sorted(Path(drafts_dir).glob("*.txt")):
+        if p.name not in done and queue_draft(outbox, channel, p):
+            queued.append(p.name)
+    return queued
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Post spooled messages / drafts to Slack")
+    ap.add_argument("--channel", default=os.getenv("SLACK_CHANNEL"), help="Channel ID for drafts")
+    ap.add_argument("--drafts", default=None, help="Queue new drafts from this directory (e.g. storage/drafts)")
+    ap.add_argument("--spool", default=None, help="Spool directory (default: storage/slack_outbox)")
+    ap.add_argument("--retries", type=int, default=5, help="Max retries per message (429 waits excluded)")
+    ap.add_argument("--max-wait", type=float, default=300.0, help="Max total Retry-After wait per message (seconds)")
+    ap.add_argument("--timeout", type=float, default=None, help="Give up waiting after N seconds")
+    args = ap.parse_args()
+
+    outbox = SlackOutbox(spool_dir=args.spool, max_retries=args.retries, max_rate_limit_wait=args.max_wait)
+    if args.drafts:
+        if not args.channel:
+            ap.error("--channel (or SLACK_CHANNEL) is required with --drafts")
+        names = enqueue_drafts(outbox, args.channel, args.drafts)
+        print(f"[slack] queued {len(names)} drafts from {args.drafts}")
+
+    outbox.start()
+    done = outbox.close(timeout=args.timeout)
+    print(
+        f"[slack] sent={outbox.sent} failed={outbox.failed} deferred={outbox.deferred} "
+        f"pending={len(outbox.pending())} claimed={len(outbox.claimed())}"
+    )
+    if not done:
+        print("[slack] timed out; remaining messages stay in the spool")
+
+
+if __name__ == "__main__":
+    main()
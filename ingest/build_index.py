@@ -1,6 +1,10 @@
 import argparse
 import json
+import shutil
+import time
+import uuid
 from pathlib import Path
+import numpy as np
 import chromadb
 from chromadb.utils import embedding_functions
 
@@ -8,7 +12,16 @@ def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--chunks", required=True, help="JSONL chunks file")
     ap.add_argument("--db", required=True, help="Chroma directory")
+    # --- compact index options (either one enables it) ---
+    ap.add_argument("--dim", type=int, default=None, help="PCA-reduce first-stage vectors to N dims")
+    ap.add_argument("--quant", choices=("none", "int8", "binary"), default=None, help="Quantize first-stage vectors")
+    ap.add_argument("--oversample", type=int, default=4, help="Rescore k*N candidates in the recall report")
+    ap.add_argument("--eval-file", default=None, help="Real queries for recall@k (one per line)")
+    ap.add_argument("--eval-queries", type=int, default=100, help="Chunks sampled as queries if no --eval-file")
+    ap.add_argument("--eval-k", type=int, default=10, help="k for recall@k")
     args = ap.parse_args()
+    if args.dim is not None and args.dim < 1:
+        ap.error(f"--dim must be >= 1, got {args.dim}")
 
     db_dir = Path(args.db)
     db_dir.mkdir(parents=True, exist_ok=True)
@@ -18,11 +31,13 @@ def main():
     ef = embedding_functions.SentenceTransformerEmbeddingFunction(
         model_name="intfloat/multilingual-e5-large"
     )
-    col = client.get_or_create_collection(
-        name="days_collection",
-        embedding_function=ef,
-        metadata={"hnsw:space": "cosine"},
-    )
+    compact = args.dim is not None or args.quant is not None
+    if not compact:
+        col = client.get_or_create_collection(
+            name="days_collection",
+            embedding_function=ef,
+            metadata={"hnsw:space": "cosine"},
+        )
 
     ids, texts, metas = [], [], []
     with open(args.chunks, "r", encoding="utf-8") as fr:
@@ -35,11 +50,120 @@ def main():
             texts.append(obj["text"])
             metas.append(meta)
 
+    if compact:
+        if not ids:
+            print(f"⚠️ No chunks in {args.chunks}; compact index left unchanged")
+            return
+        build_compact(args, client, db_dir, ef, ids, texts, metas)
+        return
+
     # Upsert
     if ids:
         col.upsert(ids=ids, documents=texts, metadatas=metas)
 
     print(f"✅ Indexed {len(ids)} chunks into Chroma at {db_dir}")
+    drop_compact(client, db_dir)
+
+def drop_compact(client, db_dir):
+    """
+    A plain build supersedes any compact index: Retriever prefers <db>/compact
+    when it exists, so leaving it would keep serving the old corpus.
+    """
+    cdir = db_dir / "compact"  # rag.compact_index.COMPACT_DIRNAME
+    if not cdir.exists():
+        return
+    meta = cdir / "meta.json"
+    name = json.loads(meta.read_text(encoding="utf-8")).get("collection") if meta.exists() else None
+    shutil.rmtree(cdir)
+    if name:
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+    print(f"   removed the previous compact index ({cdir})")
+
+def build_compact(args, client, db_dir, ef, ids, texts, metas):
+    """
+    Store compressed first-stage vectors in <db>/compact (full vectors go to
+    disk for rescoring only) and report memory saved / recall@k vs full search.
+    Everything is built into compact.tmp + a fresh collection and swapped in
+    only once it succeeded, so a failed build leaves the previous index usable.
+    """
+    # imported here so the plain build keeps working as `python ingest/build_index.py`
+    from rag.compact_index import COMPACT_DIRNAME, CompactIndex
+
+    final = db_dir / COMPACT_DIRNAME
+    tmp = db_dir / f"{COMPACT_DIRNAME}.tmp"
+    # uuid suffix: two builds in the same second must never share (or delete) a collection
+    name = f"days_collection_compact_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    created = False
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        emb = np.asarray(ef(texts), dtype=np.float32)
+        ix = CompactIndex.build(
+            str(tmp), ids, emb,
+            dim=args.dim, quant=args.quant or "none", collection=name,
+        )
+        # Chroma only serves documents/metadata by id and is never searched,
+        # so a 1-dim placeholder keeps it from storing another copy of the vectors
+        col = client.create_collection(name=name)
+        created = True
+        col.upsert(ids=ids, documents=texts, metadatas=metas, embeddings=[[1.0]] * len(ids))
+
+        mem = ix.memory_report()
+        # recall@k of compressed search vs exact full-precision search
+        if args.eval_file:
+            # embedded the same way Retriever embeds a query
+            lines = Path(args.eval_file).read_text(encoding="utf-8").splitlines()
+            qtexts = [ln.strip() for ln in lines if ln.strip()]
+            queries = np.asarray(ef(qtexts), dtype=np.float32) if qtexts else emb[:0]
+            rec = ix.recall_report(queries, k=args.eval_k, oversample=args.oversample)
+            source = args.eval_file
+        else:
+            # chunks double as queries; their own row is excluded from the results
+            rng = np.random.default_rng(0)
+            sample = rng.choice(len(emb), size=min(args.eval_queries, len(emb)), replace=False)
+            queries = emb[sample]
+            rec = ix.recall_report(queries, k=args.eval_k, oversample=args.oversample, exclude=sample)
+            source = "corpus sample (self-match excluded)"
+        report = {
+            "memory": mem, "recall": rec, "oversample": args.oversample,
+            "queries": len(queries), "query_source": source,
+        }
+        (tmp / "report.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+        dim, quant = ix.meta["dim"], ix.quant
+        ix = None  # release the full.npy memmap before moving the directory
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if created:  # never touch a collection this run did not make
+            try:
+                client.delete_collection(name)
+            except Exception:
+                pass
+        raise
+
+    # swap in, then drop the previous build
+    old_meta = final / "meta.json"
+    old_name = json.loads(old_meta.read_text(encoding="utf-8")).get("collection") if old_meta.exists() else None
+    if final.exists():
+        old_dir = db_dir / f"{COMPACT_DIRNAME}.old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        final.rename(old_dir)
+        tmp.rename(final)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        tmp.rename(final)
+    if old_name:
+        try:
+            client.delete_collection(old_name)
+        except Exception:
+            pass
+
+    print(f"✅ Indexed {len(ids)} chunks (compact: dim={dim}, quant={quant}) at {db_dir}")
+    print(f"   vectors in RAM: {mem['compact_bytes'] / 1e6:.2f} MB "
+          f"(full float32: {mem['full_bytes'] / 1e6:.2f} MB, {mem['ratio']:.1f}x smaller)")
+    print(f"   recall@{rec['k']}: first stage {rec['first_stage']:.3f}, "
+          f"rescored (x{args.oversample}) {rec['rescored']:.3f}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,216 @@
+# rag/compact_index.py
+# Compressed first-stage vectors + full-precision rescoring from disk
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Layout under <db>/compact/:
+#   meta.json   settings + ids + chroma collection name
+#   codes.npy   first-stage vectors (float32 reduced / int8 / packed bits), loaded into RAM
+#   aux.npz     mean, PCA components, int8 step (whatever the settings need)
+#   full.npy    normalized float32 vectors, memory-mapped and read only for rescoring
+COMPACT_DIRNAME = "compact"
+QUANT_MODES = ("none", "int8", "binary")
+
+# popcount lookup for hamming distance on packed bits
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_BLOCK = 65536  # rows per scoring block (bounds temporary memory)
+_FIT_BLOCK = 8192  # rows per block when fitting PCA / encoding (float64/centered copies)
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(n, 1e-12)
+
+
+class CompactIndex:
+    """
+    Brute-force first stage over compressed vectors, then exact cosine
+    rescoring of the top candidates using full vectors read from disk.
+
+      - dim:   PCA-reduce to this many dimensions (None keeps the full dimension)
+      - quant: 'none' (float32), 'int8' (per-dim min/max) or 'binary' (sign bits)
+    """
+
+    def __init__(self, path: str, meta: Dict, codes: np.ndarray, aux: Dict[str, np.ndarray]) -> None:
+        self.path = Path(path)
+        self.meta = meta
+        self.ids: List[str] = meta["ids"]
+        self.quant = meta["quant"]
+        self.codes = codes
+        self.aux = aux
+        self._full: Optional[np.ndarray] = None
+
+    # --- build / load ---
+    @classmethod
+    def build(
+        cls,
+        path: str,
+        ids: List[str],
+        embeddings: np.ndarray,
+        dim: Optional[int] = None,
+        quant: str = "none",
+        collection: str = "days_collection_compact",
+    ) -> "CompactIndex":
+        if quant not in QUANT_MODES:
+            raise ValueError(f"quant must be one of {QUANT_MODES}, got {quant!r}")
+        if dim is not None and dim < 1:
+            raise ValueError(f"dim must be >= 1, got {dim}")
+        full = _normalize(np.asarray(embeddings, dtype=np.float32))
+        n, d = full.shape
+        aux: Dict[str, np.ndarray] = {}
+
+        # center for PCA and for sign bits (raw e5 vectors share signs on many dims)
+        if dim or quant == "binary":
+            aux["mean"] = full.mean(axis=0)
+        if dim:
+            # cannot keep more components than samples
+            dim = min(dim, d, n)
+            # eigenvectors of the d x d scatter matrix, accumulated in blocks:
+            # no n x d centered copy / SVD factor of the whole corpus in RAM
+            cov = np.zeros((d, d), dtype=np.float64)
+            for i in range(0, n, _FIT_BLOCK):
+                xb = full[i:i + _FIT_BLOCK].astype(np.float64) - aux["mean"]
+                cov += xb.T @ xb
+            _, vecs = np.linalg.eigh(cov)  # ascending eigenvalues
+            aux["components"] = vecs[:, ::-1][:, :dim].T.astype(np.float32)
+
+        red = np.concatenate([
+            cls._reduce(full[i:i + _FIT_BLOCK], aux) for i in range(0, n, _FIT_BLOCK)
+        ]) if n else cls._reduce(full, aux)
+        if quant == "int8":
+            lo, hi = red.min(axis=0), red.max(axis=0)
+            step = np.maximum(hi - lo, 1e-12) / 255.0
+            codes = (np.round((red - lo) / step) - 128).astype(np.int8)
+            aux["step"] = step.astype(np.float32)
+        elif quant == "binary":
+            codes = np.packbits(red > 0, axis=1)
+        else:
+            codes = red.astype(np.float32)
+
+        out = Path(path)
+        out.mkdir(parents=True, exist_ok=True)
+        np.save(out / "full.npy", full)
+        np.save(out / "codes.npy", codes)
+        np.savez(out / "aux.npz", **aux)
+        meta = {
+            "n": n, "full_dim": d, "dim": int(red.shape[1]), "quant": quant,
+            "collection": collection, "ids": list(ids),
+        }
+        (out / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        return cls(str(out), meta, codes, aux)
+
+    @classmethod
+    def load(cls, path: str) -> "CompactIndex":
+        p = Path(path)
+        meta = json.loads((p / "meta.json").read_text(encoding="utf-8"))
+        codes = np.load(p / "codes.npy")
+        with np.load(p / "aux.npz") as z:
+            aux = {k: z[k] for k in z.files}
+        return cls(str(p), meta, codes, aux)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return (Path(path) / "meta.json").exists()
+
+    # --- transforms ---
+    @staticmethod
+    def _reduce(x: np.ndarray, aux: Dict[str, np.ndarray]) -> np.ndarray:
+        if "mean" in aux:
+            x = x - aux["mean"]
+        if "components" in aux:
+            x = x @ aux["components"].T
+        return _normalize(x).astype(np.float32)
+
+    def reduce(self, x: np.ndarray) -> np.ndarray:
+        """Project full vectors into the first-stage space (before quantization)."""
+        return self._reduce(_normalize(np.asarray(x, dtype=np.float32)), self.aux)
+
+    @property
+    def full(self) -> np.ndarray:
+        # memory-mapped: only the rows we rescore are paged in
+        if self._full is None:
+            self._full = np.load(self.path / "full.npy", mmap_mode="r")
+        return self._full
+
+    # --- search ---
+    def first_stage(self, qvec: np.ndarray, n: int) -> np.ndarray:
+        """Indices of the n best candidates by compressed score."""
+        q = self.reduce(np.asarray(qvec)[None, :])[0]
+        if self.quant == "binary":
+            qb = np.packbits(q > 0)
+            # negate hamming distance so that higher is better
+            scores = np.concatenate([
+                -_POPCOUNT[np.bitwise_xor(self.codes[i:i + _BLOCK], qb)].sum(axis=1, dtype=np.int32)
+                for i in range(0, len(self.codes), _BLOCK)
+            ]) if len(self.codes) else np.empty(0, dtype=np.int32)
+        else:
+            if self.quant == "int8":
+                # dequantized dot = codes @ (step*q) + const, so the const can be dropped
+                q = q * self.aux["step"]
+            scores = np.concatenate([
+                self.codes[i:i + _BLOCK].astype(np.float32) @ q
+                for i in range(0, len(self.codes), _BLOCK)
+            ]) if len(self.codes) else np.empty(0, dtype=np.float32)
+        n = min(n, len(scores))
+        if n <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, n - 1)[:n]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def _rescore(self, qvec: np.ndarray, top_k: int, oversample: int) -> Tuple[np.ndarray, np.ndarray]:
+        cand = self.first_stage(qvec, top_k * max(oversample, 1))
+        if not len(cand):
+            return cand, np.empty(0, dtype=np.float32)
+        q = _normalize(np.asarray(qvec, dtype=np.float32))
+        rows = np.sort(cand)  # sequential reads from the memmap
+        sims = np.asarray(self.full[rows]) @ q
+        order = np.argsort(-sims, kind="stable")[:top_k]
+        return rows[order], sims[order]
+
+    def search(self, qvec: np.ndarray, top_k: int, oversample: int = 4) -> Tuple[List[str], List[float]]:
+        """Return (ids, cosine distances) after rescoring top_k*oversample candidates."""
+        rows, sims = self._rescore(qvec, top_k, oversample)
+        return [self.ids[r] for r in rows], [float(1.0 - s) for s in sims]
+
+    # --- reporting ---
+    def memory_report(self) -> Dict[str, float]:
+        full_bytes = self.meta["n"] * self.meta["full_dim"] * 4
+        compact_bytes = int(self.codes.nbytes + sum(a.nbytes for a in self.aux.values()))
+        return {
+            "full_bytes": full_bytes,
+            "compact_bytes": compact_bytes,
+            "ratio": full_bytes / compact_bytes if compact_bytes else 0.0,
+        }
+
+    def recall_report(
+        self, queries: np.ndarray, k: int = 10, oversample: int = 4,
+        exclude: Optional[Sequence[int]] = None,
+    ) -> Dict[str, float]:
+        """
+        recall@k against exact full-precision search, for the compressed
+        first stage alone and after rescoring. When the queries are corpus
+        vectors, pass their rows as `exclude` so the trivial self-match is
+        dropped from every result list.
+        """
+        full = np.asarray(self.full)
+        extra = 1 if exclude is not None else 0
+        k = min(k, len(full) - extra)
+        if k <= 0 or not len(queries):
+            return {"k": k, "first_stage": 0.0, "rescored": 0.0}
+        hit_first, hit_rescored = 0, 0
+        for j, qv in enumerate(queries):
+            skip = int(exclude[j]) if exclude is not None else -1
+
+            def top(rows: np.ndarray) -> set:
+                return set([r for r in rows.tolist() if r != skip][:k])
+
+            q = _normalize(np.asarray(qv, dtype=np.float32))
+            exact = top(np.argsort(-(full @ q), kind="stable")[:k + extra])
+            hit_first += len(exact & top(self.first_stage(qv, k + extra)))
+            rows, _ = self._rescore(qv, k + extra, oversample)
+            hit_rescored += len(exact & top(rows))
+        total = k * len(queries)
+        return {"k": k, "first_stage": hit_first / total, "rescored": hit_rescored / total}
@@ -151,6 +151,8 @@ def main():
     ap.add_argument("--rrk-top", type=int, default=None, help="Top-N after rerank (default=k)")
     ap.add_argument("--rrk-backend", default=None, help="ce (default) or bge")
     ap.add_argument("--rrk-model", default=None, help="Override model name")
+    ap.add_argument("--slack-channel", default=None, help="Also queue the draft to this Slack channel")
+    ap.add_argument("--slack-wait", type=float, default=10.0, help="Seconds to wait for Slack delivery (rest stays spooled)")
     args = ap.parse_args()
 
     # Retrieve
@@ -208,6 +210,21 @@ def main():
     print(out)
     print(f"\n[Saved] {hist_path}")
 
+    # Slack delivery runs off the spool; a slow/limited Slack does not block generation
+    if args.slack_channel:
+        from adapters.post_slack import SlackOutbox, queue_draft
+        outbox = SlackOutbox()
+        # spool first: even without a token the draft is kept for a later post_slack.py run
+        queue_draft(outbox, args.slack_channel, hist_path, text=out)
+        later = f"queued in {outbox.spool_dir} (send later: python adapters/post_slack.py)"
+        try:
+            outbox.start()
+        except RuntimeError as e:
+            print(f"[Slack] {e}; {later}")
+        else:
+            if not outbox.close(timeout=args.slack_wait):
+                print(f"[Slack] still {later}")
+
 if __name__ == "__main__":
     main()
 
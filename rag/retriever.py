@@ -1,21 +1,56 @@
-from typing import List, Dict, Any
+import os
+from pathlib import Path
+from typing import List, Dict, Any, Optional
 import chromadb
 from chromadb.api.types import Documents, EmbeddingFunction
 from chromadb.utils import embedding_functions
+from rag.compact_index import COMPACT_DIRNAME, CompactIndex
 
 # Simple retriever for the 'days_collection'
+# If <db>/compact exists (build_index --dim/--quant), search the compressed
+# vectors first and rescore the top candidates with full vectors from disk.
+# Whichever build ran last wins: a plain build_index removes <db>/compact.
 class Retriever:
-    def __init__(self, db_path: str, top_k: int = 5):
+    def __init__(self, db_path: str, top_k: int = 5, compact: Optional[bool] = None, oversample: Optional[int] = None):
         self.client = chromadb.PersistentClient(path=db_path)
         ef = embedding_functions.SentenceTransformerEmbeddingFunction(
             model_name="intfloat/multilingual-e5-large"
         )
-        self.col = self.client.get_collection("days_collection", embedding_function=ef)
         self.top_k = top_k
 
+        compact_dir = Path(db_path) / COMPACT_DIRNAME
+        if compact is None:
+            compact = CompactIndex.exists(str(compact_dir))
+        self.index: Optional[CompactIndex] = None
+        if compact:
+            self.index = CompactIndex.load(str(compact_dir))
+            self.ef = ef
+            self.oversample = oversample or int(os.getenv("RAG_OVERSAMPLE", "4"))
+            # documents/metadata only; the HNSW part of this collection is never queried
+            self.col = self.client.get_collection(self.index.meta["collection"])
+        else:
+            self.col = self.client.get_collection("days_collection", embedding_function=ef)
+
     def query(self, text: str) -> List[Dict[str, Any]]:
+        if self.index is not None:
+            return self._query_compact(text)
         res = self.col.query(query_texts=[text], n_results=self.top_k)
         items = []
         for doc, meta, dist in zip(res["documents"][0], res["metadatas"][0], res["distances"][0]):
             items.append({"text": doc, "metadata": meta, "distance": float(dist)})
         return items
+
+    def _query_compact(self, text: str) -> List[Dict[str, Any]]:
+        qvec = self.ef([text])[0]
+        ids, dists = self.index.search(qvec, self.top_k, oversample=self.oversample)
+        if not ids:
+            return []
+        res = self.col.get(ids=ids, include=["documents", "metadatas"])
+        # get() does not keep the requested order
+        by_id = {i: (doc, meta) for i, doc, meta in zip(res["ids"], res["documents"], res["metadatas"])}
+        items = []
+        for rid, dist in zip(ids, dists):
+            if rid in by_id:
+                doc, meta = by_id[rid]
+                items.append({"text": doc, "metadata": meta, "distance": float(dist)})
+        return items
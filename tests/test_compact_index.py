@@ -0,0 +1,89 @@
+# Encode / search paths of rag/compact_index.py on synthetic data
+import numpy as np
+import pytest
+
+from rag.compact_index import CompactIndex
+
+
+def _corpus(n=1500, d=96, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, d)) * 3
+    x = centers[rng.integers(0, clusters, n)] + rng.normal(size=(n, d))
+    # shared offset: like raw e5 vectors, most dims keep one sign
+    return (x + 2.0).astype(np.float32), rng
+
+
+def _unit(x):
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def _build(tmp_path, x, **kw):
+    return CompactIndex.build(str(tmp_path / "compact"), [f"id{i}" for i in range(len(x))], x, **kw)
+
+
+def test_pca_components_match_svd(tmp_path):
+    x, _ = _corpus()
+    ix = _build(tmp_path, x, dim=16)
+    comps = ix.aux["components"]
+    np.testing.assert_allclose(comps @ comps.T, np.eye(16), atol=1e-4)
+    xn = _unit(x)
+    _, _, vt = np.linalg.svd(xn - xn.mean(axis=0), full_matrices=False)
+    # same subspace, up to sign
+    np.testing.assert_allclose(np.abs((comps * vt[:16]).sum(axis=1)), 1.0, atol=1e-3)
+
+
+@pytest.mark.parametrize("dim", [0, -5])
+def test_invalid_dim_is_rejected(tmp_path, dim):
+    x, _ = _corpus(n=50)
+    with pytest.raises(ValueError):
+        _build(tmp_path, x, dim=dim)
+
+
+@pytest.mark.parametrize("dim", [None, 32])
+def test_int8_shortcut_ranks_like_dequantized_dot(tmp_path, dim):
+    x, rng = _corpus()
+    ix = _build(tmp_path, x, dim=dim, quant="int8")
+    red = ix.reduce(x)
+    lo, step = red.min(axis=0), ix.aux["step"]
+    dequant = (ix.codes.astype(np.float32) + 128) * step + lo
+    np.testing.assert_allclose(dequant, red, atol=float(step.max()))
+    for qv in rng.normal(size=(5, x.shape[1])) + 2.0:
+        q = ix.reduce(qv[None, :])[0]
+        expected = np.argsort(-(dequant @ q), kind="stable")[:20]
+        np.testing.assert_array_equal(ix.first_stage(qv, 20), expected)
+
+
+def test_binary_ranks_by_hamming_distance(tmp_path):
+    x, rng = _corpus()
+    ix = _build(tmp_path, x, quant="binary")
+    bits = np.unpackbits(ix.codes, axis=1)[:, : x.shape[1]]
+    for qv in rng.normal(size=(5, x.shape[1])) + 2.0:
+        qbits = (ix.reduce(qv[None, :])[0] > 0).astype(np.uint8)
+        ham = (bits != qbits).sum(axis=1)
+        got = ix.first_stage(qv, 20)
+        # ties make the ids ambiguous, the distances are not
+        np.testing.assert_array_equal(ham[got], np.sort(ham)[:20])
+
+
+@pytest.mark.parametrize("dim,quant", [(None, "none"), (32, "none"), (None, "int8"), (32, "binary")])
+def test_rescoring_all_candidates_is_exact(tmp_path, dim, quant):
+    x, rng = _corpus()
+    ix = CompactIndex.load(str(_build(tmp_path, x, dim=dim, quant=quant).path))
+    qv = rng.normal(size=x.shape[1]) + 2.0
+    ids, dists = ix.search(qv, 10, oversample=len(x))
+    sims = _unit(x) @ _unit(qv)
+    exact = np.argsort(-sims, kind="stable")[:10]
+    assert ids == [f"id{i}" for i in exact]
+    np.testing.assert_allclose(dists, 1.0 - sims[exact], atol=1e-5)
+
+
+def test_recall_report_excludes_self_match(tmp_path):
+    x, rng = _corpus()
+    ix = _build(tmp_path, x)  # uncompressed: first stage is exact
+    sample = rng.choice(len(x), size=20, replace=False)
+    rec = ix.recall_report(x[sample], k=5, exclude=sample)
+    assert rec == {"k": 5, "first_stage": 1.0, "rescored": 1.0}
+    # the query's own row no longer counts towards k
+    assert ix.recall_report(x[:1], k=len(x), exclude=[0])["k"] == len(x) - 1
+    mem = ix.memory_report()
+    assert mem["full_bytes"] == len(x) * x.shape[1] * 4
@@ -0,0 +1,210 @@
+# Delivery paths of adapters/post_slack.py against a local stub Slack API
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+from slack_sdk import WebClient
+
+from adapters.post_slack import SlackOutbox, SlackRetryLater, _send, enqueue_drafts, queue_draft
+
+
+class StubSlack:
+    """
+    Minimal chat.postMessage endpoint. `script` is a list of responses
+    (status, body, headers) served in order; afterwards every call is ok.
+    """
+
+    def __init__(self):
+        self.script = []
+        self.posted = []  # texts of successful posts
+        self.calls = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    form = json.loads(raw)
+                else:
+                    form = {k: v[0] for k, v in parse_qs(raw).items()}
+                stub.calls += 1
+                if stub.script:
+                    status, body, headers = stub.script.pop(0)
+                else:
+                    status, body, headers = 200, {"ok": True, "ts": "1.0"}, {}
+                    stub.posted.append(form.get("text"))
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(json.dumps(body).encode())
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/api/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def client(self):
+        # no SDK-level retries: the retry policy under test is ours
+        return WebClient(token="xoxb-test", base_url=self.base_url, retry_handlers=[])
+
+
+@pytest.fixture
+def stub():
+    s = StubSlack()
+    yield s
+    s.server.shutdown()
+
+
+def _send_fast(client, max_retries=3, max_rate_limit_wait=5.0):
+    _send(client, "C1", "hello", max_retries, base_delay=0.01, max_rate_limit_wait=max_rate_limit_wait)
+
+
+def test_retry_after_is_honoured(stub):
+    stub.script = [(429, {"ok": False, "error": "ratelimited"}, {"Retry-After": "1"})]
+    t = time.monotonic()
+    _send_fast(stub.client())
+    assert time.monotonic() - t >= 1.0
+    assert stub.posted == ["hello"]
+
+
+def test_rate_limit_wait_is_capped(stub):
+    stub.script = [(429, {"ok": False, "error": "ratelimited"}, {"Retry-After": "1"})] * 10
+    with pytest.raises(SlackRetryLater):
+        _send_fast(stub.client(), max_rate_limit_wait=1.5)
+    assert stub.calls == 2
+
+
+def test_server_errors_are_retried(stub):
+    stub.script = [(503, {"ok": False, "error": "service_unavailable"}, {})] * 2
+    _send_fast(stub.client())
+    assert stub.calls == 3
+    assert stub.posted == ["hello"]
+
+
+def test_other_errors_are_not_retried(stub):
+    stub.script = [(200, {"ok": False, "error": "invalid_arguments"}, {})]
+    with pytest.raises(RuntimeError) as e:
+        _send_fast(stub.client())
+    assert not isinstance(e.value, SlackRetryLater)
+    assert stub.calls == 1
+
+
+def test_outbox_moves_bad_messages_to_failed(stub, tmp_path):
+    stub.script = [(200, {"ok": False, "error": "channel_not_found"}, {})]
+    ob = SlackOutbox(spool_dir=str(tmp_path), base_delay=0.01, client=stub.client())
+    ob.enqueue("C_BAD", "bad")
+    ob.enqueue("C1", "good")
+    ob.start()
+    assert ob.close(timeout=10)
+    assert (ob.sent, ob.failed) == (1, 1)
+    assert stub.posted == ["good"]
+    failed = list((tmp_path / "failed").glob("*.json"))
+    assert len(failed) == 1
+    assert json.loads(failed[0].read_text(encoding="utf-8"))["channel"] == "C_BAD"
+    assert ob.pending() == []
+
+
+def test_spooled_messages_are_resent_by_a_new_outbox(stub, tmp_path):
+    # first process: spools, never starts (crash / no token)
+    SlackOutbox(spool_dir=str(tmp_path)).enqueue("C1", "from last run")
+    # exhausted transient retries keep the message in the spool
+    stub.script = [(500, {"ok": False, "error": "internal_error"}, {})] * 2
+    ob = SlackOutbox(spool_dir=str(tmp_path), max_retries=1, base_delay=0.01, client=stub.client())
+    ob.start()
+    assert ob.close(timeout=10)
+    assert ob.deferred == 1 and len(ob.pending()) == 1
+
+    ob = SlackOutbox(spool_dir=str(tmp_path), base_delay=0.01, client=stub.client())
+    ob.start()
+    assert ob.close(timeout=10)
+    assert stub.posted == ["from last run"]
+    assert ob.pending() == []
+
+
+def test_claimed_files_are_not_sent_twice(stub, tmp_path):
+    ob = SlackOutbox(spool_dir=str(tmp_path), client=stub.client())
+    path = ob.enqueue("C1", "once")
+    # another process got there first
+    path.rename(path.with_suffix(".sending"))
+    ob.start()
+    assert ob.close(timeout=10)
+    assert stub.posted == []
+
+
+def test_drafts_are_queued_once(stub, tmp_path):
+    drafts = tmp_path / "drafts"
+    drafts.mkdir()
+    (drafts / "a.txt").write_text("draft a", encoding="utf-8")
+    ob = SlackOutbox(spool_dir=str(tmp_path / "spool"), client=stub.client())
+    # draft_today path
+    queue_draft(ob, "C1", drafts / "b.txt", text="draft b")
+    assert enqueue_drafts(ob, "C1", str(drafts)) == ["a.txt"]
+    (drafts / "b.txt").write_text("draft b", encoding="utf-8")
+    assert enqueue_drafts(ob, "C1", str(drafts)) == []
+    ob.start()
+    assert ob.close(timeout=10)
+    assert sorted(stub.posted) == ["draft a", "draft b"]
+
+
+def test_bad_spool_file_does_not_stop_the_worker(stub, tmp_path):
+    (tmp_path / "0_bad.json").write_text('{"channel": "C1", "te', encoding="utf-8")
+    ob = SlackOutbox(spool_dir=str(tmp_path), client=stub.client())
+    ob.enqueue("C1", "still sent")
+    ob.start()
+    assert ob.close(timeout=10)
+    assert stub.posted == ["still sent"]
+    assert (tmp_path / "failed" / "0_bad.json").exists()
+    assert list(tmp_path.glob("*.sending")) == []
+
+
+def test_unexpected_send_errors_keep_the_message(tmp_path):
+    class Broken:
+        def chat_postMessage(self, **kwargs):
+            raise ValueError("IncompleteRead-like")
+
+    ob = SlackOutbox(spool_dir=str(tmp_path), client=Broken())
+    path = ob.enqueue("C1", "later")
+    ob.start()
+    assert ob.close(timeout=10)
+    assert ob.deferred == 1
+    assert ob.pending() == [path]
+
+
+def test_timeout_during_retry_after_hands_the_message_back(stub, tmp_path):
+    stub.script = [(429, {"ok": False, "error": "ratelimited"}, {"Retry-After": "30"})]
+    ob = SlackOutbox(spool_dir=str(tmp_path), client=stub.client())
+    path = ob.enqueue("C1", "after restart")
+    ob.start()
+    t = time.monotonic()
+    assert not ob.close(timeout=1)
+    assert time.monotonic() - t < 5
+    assert ob.pending() == [path] and ob.claimed() == []
+
+    ob = SlackOutbox(spool_dir=str(tmp_path), client=stub.client())
+    ob.start()
+    assert ob.close(timeout=10)
+    assert stub.posted == ["after restart"]
+
+
+def test_timeout_during_http_call_hands_the_claim_back(tmp_path, monkeypatch):
+    import adapters.post_slack as post_slack
+    monkeypatch.setattr(post_slack, "_STOP_GRACE_SEC", 0.2)
+    release = threading.Event()
+
+    class Hanging:
+        def chat_postMessage(self, **kwargs):
+            release.wait(10)
+
+    ob = SlackOutbox(spool_dir=str(tmp_path), client=Hanging())
+    path = ob.enqueue("C1", "in flight")
+    ob.start()
+    assert not ob.close(timeout=0.5)
+    assert ob.pending() == [path] and ob.claimed() == []
+    release.set()